@@ -0,0 +1,18 @@
+import functools
+import kingdon
+
+
+@functools.cache
+def get_algebra(p, q=0, r=0):
+    '''
+    Get the kingdon Algebra with signature (p, q, r). Cached so every script
+    in a session uses the same Algebra instance (and the same generated code)
+    '''
+    return kingdon.Algebra(p, q, r)
+
+
+def pga2d():
+    '''
+    2D plane-based geometric algebra
+    '''
+    return get_algebra(2, 0, 1)
@@ -1,16 +1,39 @@
-import kingdon
 import argparse
+import functools
+import sys
+from _algebras import get_algebra
 
 
-def display_componentwise(multivec, basis):
+def split_components(multivec_str):
     '''
-    for index, value in zip(multivec.keys(), multivec.values()):
-        component = value * basis[index]
-        print(component)
+    Split the string form of a multivector on the " + " between components,
+    ignoring any inside a parenthesized coefficient
     '''
-    for x in multivec.grades:
-        grade_str = str(multivec.grade(x))
-        print(grade_str.replace("+ (", "\n("))
+    components = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(multivec_str):
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif depth == 0 and multivec_str.startswith(" + ", i):
+            components.append(multivec_str[start:i])
+            start = i + len(" + ")
+    components.append(multivec_str[start:])
+    return components
+
+
+def display_componentwise(multivec, algebra):
+    '''
+    for key, value in multivec.items():
+        blade = algebra.alg.blades[algebra.alg.bin2canon[key]]
+        print(f"{value}*{blade}")
+    '''
+    # Render the whole multivector once rather than once per grade, then put
+    # each component on its own line and write them out in one call
+    components = split_components(str(multivec))
+    sys.stdout.write("\n".join(components) + "\n")
 
 
 BINARY_PRODUCT_FUNCS = {
@@ -57,52 +80,82 @@ BINARY_PRODUCT_FUNCS = {
 }
 
 
-def display_binary_product(algebra, product, input_a, input_b):
-    basis = algebra.basis
-
-    func = product['func']
+def display_product_result(algebra, product, input_a, input_b, result):
     print(product['label'], "========================")
     print("A:", input_a)
     print("B:", input_b)
-    display_componentwise(func(input_a, input_b), basis)
+    display_componentwise(result, algebra)
+
 
+def display_binary_product(algebra, product, input_a, input_b):
+    func = algebra.register(product['func'])
+    result = func(input_a, input_b)
+    display_product_result(algebra, product, input_a, input_b, result)
+
+
+# kingdon names generated code after the registered function, which is not
+# a valid identifier for a lambda
+for key, entry in BINARY_PRODUCT_FUNCS.items():
+    entry['func'].__name__ = key
 
 PRODUCT_CHOICES = BINARY_PRODUCT_FUNCS.keys()
 
 
-class PGA1D:
+class BaseAlgebra:
+    def multivector(self, **components):
+        # Catch copy-paste mistakes where two blades get the same symbol
+        assert len(set(components.values())) == len(components), \
+            "duplicate coefficient names"
+        return self.alg.multivector(**components)
+
+    @functools.cache
+    def register(self, func):
+        # Registering the whole expression lets kingdon generate one function
+        # for it (e.g. all three products of the sandwich) instead of
+        # dispatching each operator separately. Caching the registration keeps
+        # the generated code around for repeated calls on this algebra.
+        #
+        # The generated code is specialized to the blades present in each
+        # input, so grade-projected inputs (e.g. vec, bivec) only pay for
+        # their nonzero components. No grade hints are needed.
+        return self.alg.register(func, symbolic=True)
+
+
+class PGA1D(BaseAlgebra):
     def __init__(self):
-        self.alg = kingdon.Algebra(1, 0, 1)
-        self.basis = list(self.alg.blades.values())
+        self.alg = get_algebra(1, 0, 1)
 
+    @functools.cache
     def make_even(self, label):
-        return self.alg.multivector(
+        return self.multivector(
             e=f'{label}s',
             e01=f'{label}ox',
         )
 
+    @functools.cache
     def make_odd(self, label):
-        return self.alg.multivector(
+        return self.multivector(
             e0=f'{label}o',
             e1=f'{label}x',
         )
 
 
-class PGA2D:
+class PGA2D(BaseAlgebra):
     def __init__(self):
-        self.alg = kingdon.Algebra(2, 0, 1)
-        self.basis = list(self.alg.blades.values())
+        self.alg = get_algebra(2, 0, 1)
 
+    @functools.cache
     def make_even(self, label):
-        return self.alg.multivector(
+        return self.multivector(
             e=f'{label}s',
             e01=f'{label}ox',
             e02=f'{label}oy',
             e12=f"{label}xy"
         )
 
+    @functools.cache
     def make_odd(self, label):
-        return self.alg.multivector(
+        return self.multivector(
             e0=f'{label}o',
             e1=f'{label}x',
             e2=f'{label}y',
@@ -110,13 +163,13 @@ class PGA2D:
         )
 
 
-class PGA3D:
+class PGA3D(BaseAlgebra):
     def __init__(self):
-        self.alg = kingdon.Algebra(3, 0, 1)
-        self.basis = list(self.alg.blades.values())
+        self.alg = get_algebra(3, 0, 1)
 
+    @functools.cache
     def make_even(self, label):
-        return self.alg.multivector(
+        return self.multivector(
             e=f'{label}s',
             e01=f'{label}ox',
             e02=f'{label}oy',
@@ -127,8 +180,9 @@ class PGA3D:
             e0123=f"{label}oxyz"
         )
 
+    @functools.cache
     def make_odd(self, label):
-        return self.alg.multivector(
+        return self.multivector(
             e0=f'{label}o',
             e1=f'{label}x',
             e2=f'{label}y',
@@ -140,21 +194,22 @@ class PGA3D:
         )
 
 
-class CGA1D:
+class CGA1D(BaseAlgebra):
     def __init__(self):
-        self.alg = kingdon.Algebra(2, 1)
-        self.basis = list(self.alg.blades.values())
+        self.alg = get_algebra(2, 1)
 
+    @functools.cache
     def make_even(self, label):
-        return self.alg.multivector(
+        return self.multivector(
             e=f'{label}s',
             e12=f'{label}xp',
             e13=f'{label}xn',
             e23=f"{label}pn",
         )
 
+    @functools.cache
     def make_odd(self, label):
-        return self.alg.multivector(
+        return self.multivector(
             e1=f'{label}x',
             e2=f'{label}p',
             e3=f'{label}n',
@@ -162,13 +217,13 @@ class CGA1D:
         )
 
 
-class CGA2D:
+class CGA2D(BaseAlgebra):
     def __init__(self):
-        self.alg = kingdon.Algebra(3, 1)
-        self.basis = list(self.alg.blades.values())
+        self.alg = get_algebra(3, 1)
 
+    @functools.cache
     def make_even(self, label):
-        return self.alg.multivector(
+        return self.multivector(
             e=f'{label}s',
             e12=f'{label}xy',
             e13=f'{label}xp',
@@ -179,8 +234,9 @@ class CGA2D:
             e1234=f"{label}xypn"
         )
 
+    @functools.cache
     def make_odd(self, label):
-        return self.alg.multivector(
+        return self.multivector(
             e1=f'{label}x',
             e2=f'{label}y',
             e3=f'{label}p',
@@ -192,13 +248,13 @@ class CGA2D:
         )
 
 
-class CGA3D:
+class CGA3D(BaseAlgebra):
     def __init__(self):
-        self.alg = kingdon.Algebra(4, 1)
-        self.basis = list(self.alg.blades.values())
+        self.alg = get_algebra(4, 1)
 
+    @functools.cache
     def make_even(self, label):
-        return self.alg.multivector(
+        return self.multivector(
             e=f'{label}s',
             e12=f'{label}xy',
             e13=f'{label}xz',
@@ -210,15 +266,16 @@ class CGA3D:
             e34=f"{label}zp",
             e35=f"{label}zn",
             e45=f"{label}pn",
-            e1234=f"{label}xyzn",
+            e1234=f"{label}xyzp",
             e1235=f"{label}xyzn",
             e1245=f"{label}xypn",
             e1345=f"{label}xzpn",
             e2345=f"{label}yzpn",
         )
 
+    @functools.cache
     def make_odd(self, label):
-        return self.alg.multivector(
+        return self.multivector(
             e1=f'{label}x',
             e2=f'{label}y',
             e3=f'{label}z',
@@ -238,56 +295,90 @@ class CGA3D:
         )
 
 
+# Store the classes rather than instances so only the selected algebra is
+# constructed.
 ALGEBRAS = {
-    'pga1': PGA1D(),
-    'pga2': PGA2D(),
-    'pga3': PGA3D(),
-    'cga1': CGA1D(),
-    'cga2': CGA2D(),
-    'cga3': CGA3D(),
+    'pga1': PGA1D,
+    'pga2': PGA2D,
+    'pga3': PGA3D,
+    'cga1': CGA1D,
+    'cga2': CGA2D,
+    'cga3': CGA3D,
 }
 
 ALGEBRA_CHOICES = ALGEBRAS.keys()
 
-INPUT_CHOICES = [
-    "even", "odd", "scalar", "vec", "bivec", "trivec", "quadvec", "pentavec"
-]
+# Only the half of the multivector that is needed gets built.
+INPUT_TYPES = {
+    "even": lambda algebra, label: algebra.make_even(label),
+    "odd": lambda algebra, label: algebra.make_odd(label),
+    "scalar": lambda algebra, label: algebra.make_even(label).grade(0),
+    "vec": lambda algebra, label: algebra.make_odd(label).grade(1),
+    "bivec": lambda algebra, label: algebra.make_even(label).grade(2),
+    "trivec": lambda algebra, label: algebra.make_odd(label).grade(3),
+    "quadvec": lambda algebra, label: algebra.make_even(label).grade(4),
+    "pentavec": lambda algebra, label: algebra.make_odd(label).grade(5),
+}
+
+INPUT_CHOICES = INPUT_TYPES.keys()
 
 
 def get_input(label, algebra, input_type):
-    even = algebra.make_even(label)
-    odd = algebra.make_odd(label)
-    match input_type:
-        case "even":
-            return even
-        case "odd":
-            return odd
-        case "scalar":
-            return even.grade(0)
-        case "vec":
-            return odd.grade(1)
-        case "bivec":
-            return even.grade(2)
-        case "trivec":
-            return odd.grade(3)
-        case "quadvec":
-            return even.grade(4)
-        case "pentavec":
-            return odd.grade(5)
-        case _:
-            raise Exception("invalid input type")
+    if input_type not in INPUT_TYPES:
+        raise Exception("invalid input type")
+    return INPUT_TYPES[input_type](algebra, label)
+
+
+def parity_part(multivec, parity):
+    return multivec.filter(lambda k, v: bin(k).count("1") % 2 == parity)
+
+
+def free_symbols(multivec):
+    # MultiVector.free_symbols fails on an empty multivector
+    return set().union(*(
+        getattr(value, "free_symbols", set()) for value in multivec.values()
+    ))
+
+
+def display_binary_product_all(algebra, product):
+    func = algebra.register(product['func'])
+    even_b = algebra.make_even("B")
+    odd_b = algebra.make_odd("B")
+    for type_a in ["even", "odd"]:
+        input_a = get_input("A", algebra, type_a)
+
+        # Every product here is linear in B, and for A of fixed parity it
+        # sends even and odd B to results of opposite parity. So a single
+        # product with the full B can be split by parity into the two
+        # results. The B symbols tell which half came from which input.
+        result = func(input_a, even_b + odd_b)
+        from_even = parity_part(result, 0)
+        from_odd = parity_part(result, 1)
+        if (free_symbols(from_even) & free_symbols(odd_b) or
+                free_symbols(from_odd) & free_symbols(even_b)):
+            from_even, from_odd = from_odd, from_even
+
+        display_product_result(algebra, product, input_a, even_b, from_even)
+        display_product_result(algebra, product, input_a, odd_b, from_odd)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("algebra", choices=ALGEBRA_CHOICES)
     parser.add_argument("product", choices=PRODUCT_CHOICES)
-    parser.add_argument("input_a", choices=INPUT_CHOICES)
-    parser.add_argument("input_b", choices=INPUT_CHOICES)
+    parser.add_argument("input_a", choices=INPUT_CHOICES, nargs="?")
+    parser.add_argument("input_b", choices=INPUT_CHOICES, nargs="?")
     args = parser.parse_args()
 
-    algebra = ALGEBRAS[args.algebra]
+    algebra = ALGEBRAS[args.algebra]()
     product = BINARY_PRODUCT_FUNCS[args.product]
-    input_a = get_input("A", algebra, args.input_a)
-    input_b = get_input("B", algebra, args.input_b)
-    display_binary_product(algebra, product, input_a, input_b)
+
+    # With no inputs, show every combination of even and odd inputs
+    if args.input_a is None and args.input_b is None:
+        display_binary_product_all(algebra, product)
+    elif args.input_a is None or args.input_b is None:
+        parser.error("input_a and input_b must be given together")
+    else:
+        input_a = get_input("A", algebra, args.input_a)
+        input_b = get_input("B", algebra, args.input_b)
+        display_binary_product(algebra, product, input_a, input_b)
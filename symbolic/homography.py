@@ -1,11 +1,15 @@
 # We want to transform the quad ABCD into the quad EFGH
+import argparse
+import functools
 import sympy
 
-# 4 input points
-Ax, Ay = sympy.symbols('Ax Ay')
-Bx, By = sympy.symbols('Bx By')
-Cx, Cy = sympy.symbols('Cx Cy')
-Dx, Dy = sympy.symbols('Dx Dy')
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "-v", "--verbose",
+    action="store_true",
+    help="also print the intermediate constraint matrices"
+)
+args = parser.parse_args()
 
 # 4 output points
 Ex, Ey = sympy.symbols('Ex Ey')
@@ -31,14 +35,9 @@ uv_input = sympy.Matrix([
     [1, 1, 1, 1]
 ])
 
-# With this input the solving takes very long. so let's not for now.
-# If we can compute the transformation and its inverse, we can compute the
-# full homography from two UV homographies.
-input = sympy.Matrix([
-    [Ax, Bx, Cx, Dx],
-    [Ay, By, Cy, Dy],
-    [1, 1, 1, 1]
-])
+# Solving with a general input quad ABCD instead of the UV square takes very
+# long, so let's not for now. If we can compute the transformation and its
+# inverse, we can compute the full homography from two UV homographies.
 
 output = sympy.Matrix([
     [p * Ex, q * Fx, r * Gx, s * Hx],
@@ -46,14 +45,16 @@ output = sympy.Matrix([
     [p, q, r, s],
 ])
 
-coordinate_constraints = H * uv_input - output
-sympy.pprint(coordinate_constraints)
-
-no_i_in_matrix = coordinate_constraints.subs(i, p)
-sympy.pprint(no_i_in_matrix)
+# Compute the product once, the variations below are derived from it
+transformed = H * uv_input
+coordinate_constraints = transformed - output
+if args.verbose:
+    sympy.pprint(coordinate_constraints)
 
+    no_i_in_matrix = coordinate_constraints.subs(i, p)
+    sympy.pprint(no_i_in_matrix)
 
-sympy.pprint(H * uv_input)
+    sympy.pprint(transformed)
 
 substitutions = [
     (i, p),
@@ -67,31 +68,80 @@ substitutions = [
     (e, Gy * r - Fy * q),
 ]
 
-simpler_matrix = (H * uv_input).subs(substitutions) - output
+# None of the replacements mention a-i, so a single simultaneous xreplace()
+# pass gives the same result as applying them in order with subs()
+simpler_matrix = transformed.xreplace(dict(substitutions)) - output
 simpler_constraints = [
     simpler_matrix[0, 3],
     simpler_matrix[1, 3],
     simpler_matrix[2, 2]
 ]
-sympy.pprint(simpler_constraints)
-results = sympy.solve(simpler_constraints, [p, q, r])
+if args.verbose:
+    sympy.pprint(simpler_constraints)
+
+
+def det3(m):
+    """
+    Determinant of a 3x3 matrix by cofactor expansion along the first row.
+    This avoids the overhead of sympy's general-purpose Matrix.det()
+    """
+    return (
+        m[0, 0] * (m[1, 1] * m[2, 2] - m[1, 2] * m[2, 1])
+        - m[0, 1] * (m[1, 0] * m[2, 2] - m[1, 2] * m[2, 0])
+        + m[0, 2] * (m[1, 0] * m[2, 1] - m[1, 1] * m[2, 0])
+    )
+
+
+@functools.cache
+def points_det(*points):
+    """
+    Determinant of the 3x3 matrix whose columns are three points in
+    homogeneous coordinates (x, y, 1)
+    """
+    return sympy.expand(det3(sympy.Matrix([
+        [x for x, _ in points],
+        [y for _, y in points],
+        [1 for _ in points],
+    ])))
+
+
+E = (Ex, Ey)
+F = (Fx, Fy)
+G = (Gx, Gy)
+H_point = (Hx, Hy)
 
 # For some reason this is the common denominator of p, q and r
-efg = sympy.Matrix([
-    [Ex, Fx, Gx],
-    [Ey, Fy, Gy],
-    [1, 1, 1]
-])
-denominator = efg.det()
+denominator = points_det(E, F, G)
 sympy.pprint(denominator)
 
-# looks like p,q,r are (det(fgh), det(egh), det(efh)) * s / det(efg) respectively... why?
+# Solving simpler_constraints for p, q, r with sympy.solve() works but is
+# slow. The solution is (det(fgh), det(egh), det(efh)) * s / det(efg), so
+# write it down directly and check it instead.
+numerators = sympy.Matrix([
+    points_det(F, G, H_point),
+    points_det(E, G, H_point),
+    points_det(E, F, H_point),
+])
+results = {
+    var: numerator * s / denominator
+    for var, numerator in zip([p, q, r], numerators)
+}
+
+# The constraints are linear in p, q, r. Written as A [p, q, r]^T = b, the
+# check becomes a polynomial identity once the denominator is cleared, which
+# avoids any rational simplification.
+A_pqr, b_pqr = sympy.linear_eq_to_matrix(simpler_constraints, [p, q, r])
+assert (A_pqr * numerators * s - b_pqr * denominator).expand().is_zero_matrix
+
+# The results are rational functions, so cancel()/factor() are enough here
+# and much cheaper than simplify()
+scale = sympy.together(denominator / s)
 for var, expr in results.items():
     sympy.pprint(var)
-    numerator = sympy.simplify(sympy.collect(expr, s) * denominator / s)
+    numerator = sympy.cancel(sympy.collect(expr, s) * scale)
     sympy.pprint(numerator)
 
-another_det = sympy.simplify(H.subs(substitutions).det())
+another_det = sympy.factor(det3(H.xreplace(dict(substitutions))))
 sympy.pprint(another_det)
 
 '''
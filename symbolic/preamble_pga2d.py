@@ -1,6 +1,6 @@
 import math
-import kingdon
-alg = kingdon.Algebra(2, 0, 1)
+from _algebras import pga2d
+alg = pga2d()
 
 
 def even(scalar, xy, xo, yo):